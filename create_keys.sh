@@ -5,9 +5,9 @@
    used here.
    https://github.com/Jigsaw-Code/outline-server/blob/master/src/shadowbox/README.md'
 read -r API_URL < management_api.url
-id=0
 first=1
 created_keys=0
+access_key_names=()
 # By default, the contacts are stored in contacts.csv.
 # fname, lname, and email are First Name, Last Name, and E-mail, respectively.
 # TODO: An argument could be used to denote the number contacts to be created instead of using an input file.
@@ -17,7 +17,7 @@ output_file="outline_keys.csv"
 echo "Output file: $output_file"
 
 # Parse and validate arguments
-while getopts "u:c" OPT; do
+while getopts "u:c:" OPT; do
     case $OPT in
     u)
         API_URL="$OPTARG"
@@ -48,57 +48,68 @@ while getopts "u:c" OPT; do
 done
 echo "Output file: $output_file, $API_URL"
 
-# TODO: Delete this key that is not going to be used.
-curl --insecure -X POST $API_URL/access-keys
 while IFS=, read -r fname lname email the_rest
 do
 	# Skipping the first row of the contacts because it is the titles.
 	if [ $first == 0 ]; then	
-		# Getting the ID of the last access key created.
-		if [ $id == 0 ]; then	
-			curl --insecure $API_URL/access-keys/ > $access_keys
-			id=`jq '.accessKeys | .[-1].id' $access_keys`
-			# TODO: If all the keys have been deleted, this part will return ul instead of a number. Therefore the key names will not correspond to the key email. One way to get around this issue is to create a key and then delete it at the end.
-			# This issue happens when the last key has been removed, too. Creating a key and removing it at the end solves this issue, as well.
-			id=${id:1:-1}
-			echo $id
-			#if [ $id is not number ]; then
-			#	curl --insecure -X POST $API_URL/access-keys
-			#	id=0
-			#	continue
-			#fi
-			first_id=$id
-			echo "first_id=$first_id"
-		fi
-		echo "ID: $id"
-		# Creating an access key
 		access_key_name="$fname $lname"
 		if [ "$access_key_name" = " " ]; then	
 			access_key_name="$email"
 		fi
 		echo "Acces Key Name: $access_key_name"
-		# TODO: Set port number to 443
-		curl --insecure -X POST $API_URL/access-keys
-		id=$(($id+1))
-		# Renaming the access key
-		curl --insecure -X PUT -F "name=$access_key_name" $API_URL/access-keys/$id/name
-		#exit
+		access_key_names+=("$access_key_name")
 		created_keys=$(($created_keys+1))
 	fi
 	first=0
 done < $contacts_file
+(( ${#access_key_names[@]} )) || { echo "No contacts in $contacts_file"; exit 1; }
+# Creating the access keys. The requests are chained with --next in a single
+# curl call, so they share one keep-alive connection instead of opening a new
+# one per key. The responses hold the new keys in the same order as the names;
+# they are saved as a JSON array so the IDs and access URLs are read from there,
+# without listing all the keys on the server.
+# TODO: Set port number to 443
+create_requests=()
+for access_key_name in "${access_key_names[@]}"; do
+	create_requests+=(--next --insecure --fail -X POST $API_URL/access-keys)
+done
+curl "${create_requests[@]:1}" | jq -s . > $access_keys
+mapfile -t ids < <(jq -r '.[].id' $access_keys)
+# The names are paired with the keys by position, so stop before renaming
+# anything unless there is exactly one valid ID per name.
+if [ ${#ids[@]} -ne ${#access_key_names[@]} ]; then
+	echo "Expected ${#access_key_names[@]} access key IDs but got ${#ids[@]}. Check $access_keys."
+	exit 1
+fi
+for id in "${ids[@]}"; do
+	if [ -z "$id" ] || [ "$id" == "null" ]; then
+		echo "Invalid access key ID \"$id\". Check $access_keys."
+		exit 1
+	fi
+done
+# Renaming the access keys. Renames of different keys are independent, so they
+# are sent together with --parallel, which multiplexes them over one HTTP/2
+# connection when the server supports it (and opens parallel connections
+# otherwise). --parallel requires curl 7.66 or later.
+rename_requests=()
+for i in "${!access_key_names[@]}"; do
+	id=${ids[$i]}
+	access_key_name=${access_key_names[$i]}
+	echo "ID: $id, Access Key Name: $access_key_name"
+	rename_requests+=(--next --insecure -X PUT -F "name=$access_key_name" $API_URL/access-keys/$id/name)
+done
+curl --parallel "${rename_requests[@]:1}"
 # TODO: Set a data limit on the access keys.
 # Outline readme suggests using the following command, but it does not work.
 curl -v --insecure -X PUT -H "Content-Type: application/json" -d '{"limit": {"bytes": 100000000}}' $API_URL/experimental/access-key-data-limit
-curl --insecure $API_URL/access-keys/ > $access_keys
-echo "KeyName,AccessKey" > all_keys.csv
-jq -r '.accessKeys[] | [.name,.accessUrl] | @csv' access_keys.json >> all_keys.csv
-echo "id: $id, first_id: $first_id, created_keys: $created_keys"
-lines=$(wc -l all_keys.csv | awk '{print $1}')
-echo "$lines"
-range="2,$((lines-id+first_id))d"
-echo "$range"
-sed $range all_keys.csv > access_keys.csv
-echo "A total of $((id-first_id)) access keys created and stored in $access_keys."
-paste -d ',' access_keys.csv contacts.csv > $output_file
+echo "A total of $created_keys access keys created and stored in $access_keys."
+# Building the header and the created keys, paired with their names, in a single
+# jq pass over the saved creation responses, and pasting them straight next to
+# the contacts without an intermediate file. The -- keeps names starting with a
+# dash from being read as jq options.
+key_rows=`jq -r '"KeyName,AccessKey", (to_entries[] | [$ARGS.positional[.key], .value.accessUrl] | @csv)' $access_keys --args -- "${access_key_names[@]}"` || {
+	echo "Could not read the access keys from $access_keys; $output_file was not written."
+	exit 1
+}
+paste -d ',' <(echo "$key_rows") $contacts_file > $output_file
 echo "You can now see the generated access keys on the Outline Manager software in addition to the file $output_file."